@@ -1,40 +1,112 @@
 # Flask API server for managing agents
 
 # Import necessary libraries
-from flask import Flask, request, jsonify, render_template, redirect, url_for
+from flask import Flask, request, jsonify, render_template
+from flask.json.provider import JSONProvider
 from flask_cors import CORS
-from werkzeug.utils import secure_filename
 
 import logging
+import orjson
 import os
 import re
-import spacy
+import tempfile
+import threading
 from spacy.lang.en.stop_words import STOP_WORDS
 
-from hsn_agent import validate_hsn, validate_hsn_list, extract_hsn_from_text, load_dataset, invalid_attempts, get_invalid_hsn_summary, log_invalid_hsn
+from hsn_agent import validate_hsn, validate_hsn_list, extract_hsn_from_text, load_dataset, replace_dataset, dataset_changed, invalid_attempts, reset_invalid_attempts, get_invalid_hsn_summary, log_invalid_hsn, EXCEL_PATH
 
-nlp = spacy.load("en_core_web_sm")
 COMMON_ENGLISH_WORDS = {
     'check', 'tell', 'about', 'show', 'list', 'find', 'give',
     'valid', 'invalid', 'code', 'codes', 'describe', 'me', 'is', 'are'
 }
 
+# Tokenizer for /chat: digit runs and words (any script, so "café" stays whole, and contractions
+# such as "don't" stay one token); separators are skipped
+_TOKEN_RE = re.compile(r"\d+|[^\W\d_]+(?:['’][^\W\d_]+)*")
+# spaCy splits "won't" and "shan't" into "wo"/"sha" + "n't" but only lists "ca" (from "can't")
+_STOP = frozenset(STOP_WORDS) | COMMON_ENGLISH_WORDS | {'wo', 'sha'}
+# Contraction endings; a contracted word is a stop word if the word before them is
+_CONTRACTION_RE = re.compile(r"(?:n['’]t|['’](?:s|m|d|ll|re|ve))\Z")
+
+def _is_stop_word(word):
+    word = word.lower()
+    return word in _STOP or _CONTRACTION_RE.sub('', word) in _STOP
+
+# JSON provider backed by orjson, used by jsonify() and request.json
+class ORJSONProvider(JSONProvider):
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        # orjson already produces bytes, so skip the str round-trip of dumps()
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(orjson.dumps(obj), mimetype="application/json")
+
 # Create Flask app and configure logging
 app = Flask(__name__)
+app.json = ORJSONProvider(app)
 CORS(app)
 
-UPLOAD_FOLDER = os.path.dirname(os.path.abspath(__file__)) 
+UPLOAD_FOLDER = os.path.dirname(os.path.abspath(EXCEL_PATH))
 ALLOWED_EXTENSIONS = {'xlsx'} 
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 
 # Configure logging to output to console
 logging.basicConfig(format='%(asctime)s - %(levelname)s - %(message)s', datefmt='%Y-%m-%d %H:%M:%S', level=logging.INFO)
 
+# State of this process's background dataset reload, polled via /reload_status
+_reload_done = threading.Event()
+_reload_done.set()
+_reload_error = None
+_reload_start_lock = threading.Lock()
+
+def _safe_reload():
+    global _reload_error
+    try:
+        load_dataset()
+        _reload_error = None
+    except Exception as e:
+        _reload_error = str(e)
+        logging.error(f"Dataset reload failed: {e}")
+    finally:
+        _reload_done.set()
+
+# Runs fn on a real OS thread. Under gunicorn's gevent workers threading is monkey-patched and a
+# threading.Thread is only a greenlet, so the CPU-bound Excel parse would stall every request on the
+# worker; gevent's threadpool runs it on a native thread while the hub keeps serving.
+def _run_in_os_thread(fn):
+    try:
+        from gevent import get_hub, monkey
+    except ImportError:
+        monkey = None
+    if monkey is not None and monkey.is_module_patched('threading'):
+        get_hub().threadpool.spawn(fn)
+    else:
+        threading.Thread(target=fn, daemon=True).start()
+
+def _start_reload():
+    # At most one background reload per process
+    with _reload_start_lock:
+        if not _reload_done.is_set():
+            return
+        _reload_done.clear()
+    _run_in_os_thread(_safe_reload)
+
+# Each gunicorn worker has its own copy of the dataset, and an upload only reaches one of them.
+# Every worker notices the changed file on its next request and reloads in the background.
+@app.before_request
+def refresh_dataset():
+    if dataset_changed():
+        _start_reload()
+
 
 # Define home route
 @app.route('/')
 def home():
-    invalid_attempts.clear()
+    reset_invalid_attempts()
     return render_template('chat.html')
 
 def allowed_file(filename):
@@ -50,14 +122,19 @@ def upload_file():
         if file.filename == '':
             return render_template('upload.html', message="❌ No selected file.")
         if file and allowed_file(file.filename):
-            filename = secure_filename("HSN_SAC.xlsx")
-            filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-            file.save(filepath)
+            # Save to a temp file and rename it into place, so no worker reads a partial upload
+            # (openpyxl goes by the extension, so the temp file keeps .xlsx)
+            fd, tmp_path = tempfile.mkstemp(prefix='.upload-', suffix='.xlsx', dir=app.config['UPLOAD_FOLDER'])
+            os.close(fd)
+            file.save(tmp_path)
             try:
-                load_dataset()
-                return redirect(url_for('home'))
+                # Only a file that loads replaces the current dataset
+                replace_dataset(tmp_path)
             except Exception as e:
-                return render_template('upload.html', message=f"⚠️ Upload succeeded, but reload failed: {e}")
+                return render_template('upload.html', message=f"❌ Upload rejected: {e}")
+            # Reload off the request thread; the page polls /reload_status until it finishes
+            _start_reload()
+            return render_template('upload.html', message="⏳ Upload succeeded, reloading dataset…", reloading=True)
         else:
             return render_template('upload.html', message="❌ Invalid file type. Only .xlsx is allowed.")
     return render_template('upload.html')
@@ -90,39 +167,31 @@ def validate_list():
 def chat():
     data = request.json
     user_message = data.get('message', '')
-    
-    user_message = re.sub(r'[,\uFF0C;/+|\-]', ' ', user_message)
-    doc = nlp(user_message)
 
-    codes = set()
-    invalid_tokens = set()
+    # Dicts used as ordered sets: replies follow the order tokens appear in the message
+    codes = {}
+    invalid_tokens = {}
 
-    #import re
-    #text = re.sub(r'\W+', '', token.text)
+    for m in _TOKEN_RE.finditer(user_message):
+        text = m.group()
 
-    for token in doc:
-        text = token.text.strip()
-        if not text or token.is_punct:
-            continue
-        
         if text.isdigit():
             # Numeric token
             if len(text) in [2,4,6,8]:
-                codes.add(text)
+                codes.setdefault(text, None)
             else:
-                invalid_tokens.add(f"{text} (invalid format - must be 2,4,6, or 8 digits)")
+                invalid_tokens.setdefault(f"{text} (invalid format - must be 2,4,6, or 8 digits)", None)
         else:
             # Non-numeric token
             # Only add to invalid_tokens if NOT a stop word (filter normal English)
-            word = text.lower()
-            if word not in STOP_WORDS and word not in COMMON_ENGLISH_WORDS and any(c.isalpha() for c in word):
-                invalid_tokens.add(text)
+            if not _is_stop_word(text):
+                invalid_tokens.setdefault(text, None)
 
 
     replies = []
 
     # Validate detected codes
-    for code in sorted(codes):
+    for code in codes:
         result = validate_hsn(code)
         if result["valid"]:
             reply = f"✅ {code} is valid: {result['description']}"
@@ -138,7 +207,7 @@ def chat():
 
 
     # Show error messages for invalid tokens
-    for token in sorted(invalid_tokens):
+    for token in invalid_tokens:
         replies.append(f"❌ `{token}` is not a valid HSN code.")
 
     if not replies:
@@ -161,6 +230,10 @@ def reload_dataset():
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+@app.route('/reload_status')
+def reload_status():
+    return jsonify({"reloading": not _reload_done.is_set(), "error": _reload_error})
+
 @app.route('/admin/invalids')
 def show_invalid_summary():
     summary = get_invalid_hsn_summary(invalid_attempts)
@@ -175,9 +248,9 @@ def invalids_json():
     return jsonify(get_invalid_hsn_summary(invalid_attempts))
 
 
-# Run the Flask app
+# Run the Flask app (development only, see wsgi.py for production)
 if __name__ == '__main__':
-    app.run(debug=True)
+    app.run()
     
 # To run the server, use the command:
 # python agent_server.py
\ No newline at end of file
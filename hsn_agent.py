@@ -1,76 +1,237 @@
 # Core validation logic for HSN Agent
 
 # import necessary libraries
+import os
+import re
+import stat
+import tempfile
+import openpyxl
 import pandas as pd
-import spacy
-from collections import defaultdict
+from collections import Counter
+from functools import lru_cache
+from threading import Lock, RLock
 
-# Load the English NLP model for entity extraction (used in conversational input)
-nlp = spacy.load("en_core_web_sm")
+# Standalone 2-8 digit numbers in free-form text (candidate HSN codes), ASCII digits only like _HSN_FMT
+_NUM_RE = re.compile(r'\b[0-9]{2,8}\b')
+
+# Valid HSN code format: 2, 4, 6 or 8 ASCII digits (\d would also accept e.g. Arabic-Indic digits)
+_HSN_FMT = re.compile(r'(?:[0-9]{2}|[0-9]{4}|[0-9]{6}|[0-9]{8})\Z')
 
 # Function to extract HSN code from free-form user text Used in the conversational /chat endpoint
 def extract_hsn_from_text(text):
-    text = text.strip()
-    doc = nlp(text)
-    codes = set()
-    for token in doc:
-        if token.like_num:
-            value = token.text.strip()
-            if value.isdigit() and len(value) in [2, 4, 6, 8]:
-                codes.add(value)
-    return list(codes)
+    return list({m for m in _NUM_RE.findall(text) if len(m) in (2, 4, 6, 8)})
+
 
+# Source Excel file and the parquet copy used to skip re-parsing it on reload
+EXCEL_PATH = 'data/HSN_SAC.xlsx'
+CACHE_PATH = 'data/HSN_SAC.parquet'
 
 # Global DataFrame to hold the Excel data
 df = None
 
-# Dictionary to track invalid HSNs and reasons
-invalid_attempts = defaultdict(int)
+# Lookups built from one load of the dataset. A reload builds a new instance and swaps it in with a
+# single assignment, so readers never mix lookups from different loads. Instances hash by identity
+# and are part of the lru_cache keys below, so results cached from an old load are never returned.
+class _Dataset:
+    def __init__(self, hsn_map, prefix_map):
+        # HSNCode -> Description
+        self.hsn_map = hsn_map
+        # Parent-level (2, 4 and 6 digit) subset of hsn_map used for hierarchy checks
+        self.prefix_map = prefix_map
 
-# Function to load and clean Excel data, This can be reused to refresh the dataset dynamically (e.g., via an API endpoint)
-def load_dataset():
-    global df, invalid_attempts
+_dataset = _Dataset({}, {})
+
+# Counter to track invalid HSNs and reasons, mutated under _inv_lock from request handlers
+invalid_attempts = Counter()
+_inv_lock = Lock()
+
+# Serializes dataset reloads (e.g. a background reload after /upload and /reload_dataset)
+_reload_lock = RLock()
+
+# Stamp of the Excel file at the start of the last load attempt (None if it was missing)
+_loaded_source = None
+
+# Identifies the exact Excel file the data came from. Comparing mtimes is not enough: a file
+# replaced by cp -p, rsync -t or a git checkout can be older than the cache built from its predecessor.
+def _source_stamp():
+    st = os.stat(EXCEL_PATH)
+    return [st.st_mtime_ns, st.st_size]
+
+def _current_source():
+    try:
+        return _source_stamp()
+    except FileNotFoundError:
+        return None
+
+# True if the Excel file changed since the last load attempt, e.g. because another worker process
+# saved an upload. A file that failed to load is not reported again until it changes.
+def dataset_changed():
+    return _current_source() != _loaded_source
+
+# Returns the parquet cache only if it was built from the Excel file with this stamp
+def _read_cache(stamp):
+    if not os.path.exists(CACHE_PATH):
+        return None
+    try:
+        cached = pd.read_parquet(CACHE_PATH)
+    except (ImportError, OSError, ValueError):
+        # Unreadable cache (e.g. pyarrow missing); fall back to the Excel file
+        return None
+    return cached if cached.attrs.get('source') == stamp else None
+
+# Writes to a temp file next to the cache and renames it into place, so other workers loading
+# at the same time never read a half-written cache
+def _write_cache(data, stamp):
+    tmp_path = None
+    try:
+        cache = data[['HSNCode', 'Description']]
+        # Stored in the parquet metadata by pandas
+        cache.attrs['source'] = stamp
+        fd, tmp_path = tempfile.mkstemp(suffix='.parquet.tmp', dir=os.path.dirname(CACHE_PATH))
+        os.close(fd)
+        cache.to_parquet(tmp_path, index=False)
+        # mkstemp creates the file readable by the owner only
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, CACHE_PATH)
+    except (ImportError, OSError, ValueError):
+        # The cache is optional (e.g. pyarrow missing or read-only data dir)
+        if tmp_path and os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+# Streams the first sheet row by row (openpyxl read-only mode), keeping only the HSNCode and
+# Description columns. Returns None if the header row does not contain both.
+def _read_excel(path):
+    wb = openpyxl.load_workbook(path, read_only=True, data_only=True)
     try:
-        df = pd.read_excel('data/HSN_SAC.xlsx')
+        rows = wb.active.iter_rows(values_only=True)
+        header = [str(c).strip() if c is not None else '' for c in next(rows, ())]
+        if 'HSNCode' not in header or 'Description' not in header:
+            return None
+        code_col, desc_col = header.index('HSNCode'), header.index('Description')
+        records = [
+            (row[code_col], row[desc_col])
+            for row in rows
+            if row[code_col] is not None or row[desc_col] is not None
+        ]
+    finally:
+        wb.close()
+    return pd.DataFrame(records, columns=['HSNCode', 'Description'])
+
+# Reads and cleans an Excel file, raising if it is not a usable HSN dataset
+def _load_excel(path):
+    try:
+        data = _read_excel(path)
     except FileNotFoundError:
         raise FileNotFoundError("The Excel file 'HSN_SAC.xlsx' was not found.")
-    except pd.errors.EmptyDataError:
-        raise ValueError("The Excel file is empty or not formatted correctly.")
-    except pd.errors.ParserError:
-        raise ValueError("The Excel file is not formatted correctly or contains parsing errors.")
     except Exception as e:
         raise Exception(f"An error occurred while reading the Excel file: {e}")
 
-    # Ensure the DataFrame is not empty
-    if df.empty:
-        raise ValueError("The Excel file is empty or not formatted correctly.")
-
-    # Strip whitespace from column names
-    df.columns = df.columns.str.strip()
-
     # Ensure the required columns exist
-    if 'HSNCode' not in df.columns or 'Description' not in df.columns:
+    if data is None:
         raise ValueError("HSNCode and Description columns must be present in the Excel file.")
 
+    # Ensure the DataFrame is not empty
+    if data.empty:
+        raise ValueError("The Excel file is empty or not formatted correctly.")
+
     # Ensure the HSNCode column is of string type for consistency
-    df['HSNCode'] = df['HSNCode'].astype(str).str.strip()
+    data['HSNCode'] = data['HSNCode'].astype(str).str.strip()
 
     # Ensure the Description column is of string type for consistency
-    df['Description'] = df['Description'].astype(str)
+    data['Description'] = data['Description'].astype(str)
+
+    return data
+
+# Reads the dataset from the parquet cache if fresh, otherwise from Excel (cleaned and cached)
+def _read_source():
+    try:
+        stamp = _source_stamp()
+    except FileNotFoundError:
+        raise FileNotFoundError("The Excel file 'HSN_SAC.xlsx' was not found.")
+
+    cached = _read_cache(stamp)
+    if cached is not None:
+        # The cache was written from an already cleaned DataFrame
+        return cached
+
+    data = _load_excel(EXCEL_PATH)
+    _write_cache(data, stamp)
+    return data
+
+# Makes a cleaned DataFrame the active dataset and rebuilds the lookups derived from it
+def _install(data):
+    global df, _dataset
+
+    # Build the lookup dicts once; the first row wins for duplicate codes
+    unique = data.drop_duplicates('HSNCode')
+    parents = unique[unique['HSNCode'].str.len().isin([2, 4, 6])]
+    dataset = _Dataset(
+        dict(zip(unique['HSNCode'], unique['Description'])),
+        dict(zip(parents['HSNCode'], parents['Description'])),
+    )
+
+    df = data
+    _dataset = dataset
+
+    # Release entries keyed on the old dataset; any added concurrently can no longer be hit
+    _check_hsn.cache_clear()
+    _hierarchy.cache_clear()
+
+# Function to load and clean Excel data, This can be reused to refresh the dataset dynamically (e.g., via an API endpoint)
+def load_dataset():
+    global _loaded_source
+    # Readers are not blocked: _install swaps the new _Dataset in with a single assignment
+    with _reload_lock:
+        _loaded_source = _current_source()
+        _install(_read_source())
 
     # ✅ Clear old invalid attempts
-    invalid_attempts.clear()
+    reset_invalid_attempts()
 
-# Load the dataset once on startup
-load_dataset()
+# Moves an uploaded Excel file over EXCEL_PATH, but only if it loads; otherwise the upload is deleted,
+# the current file is left in place and the error is raised. Workers pick the new file up through
+# dataset_changed(), and the parquet cache written here saves them from parsing it again.
+def replace_dataset(path):
+    try:
+        data = _load_excel(path)
+    except Exception:
+        os.remove(path)
+        raise
+
+    # The upload is a mkstemp file (owner-only); give it the mode of the file it replaces
+    try:
+        mode = stat.S_IMODE(os.stat(EXCEL_PATH).st_mode)
+    except FileNotFoundError:
+        mode = 0o644
+    os.chmod(path, mode)
+
+    with _reload_lock:
+        os.replace(path, EXCEL_PATH)
+        _write_cache(data, _source_stamp())
 
 
 def log_invalid_hsn(hsn_code, reason, tracker):
     key = f"{reason} | {hsn_code}"
-    tracker[key] += 1
+    with _inv_lock:
+        tracker[key] += 1
+
+def reset_invalid_attempts():
+    with _inv_lock:
+        invalid_attempts.clear()
 
 def get_invalid_hsn_summary(tracker):
-    return sorted(tracker.items(), key=lambda x: x[1], reverse=True)
+    with _inv_lock:
+        return tracker.most_common()
+
+@lru_cache(maxsize=4096)
+def _hierarchy(hsn_code, dataset):
+    length = len(hsn_code)
+
+    # Only consider levels shorter than the given code (e.g., parents)
+    return {
+        hsn_code[:l]: dataset.prefix_map.get(hsn_code[:l], "Not found")
+        for l in (2, 4, 6) if l < length
+    }
 
 # Function to validate HSN hierarchy
 # ADK Intent: ValidateHSNHierarchy
@@ -79,35 +240,12 @@ def validate_hierarchy(hsn_code):
     Checks if parent HSN levels (2, 4, 6) exist for a given HSN code of length >= 2.
     Returns a dictionary of parent levels and their descriptions if found.
     """
-    hsn_code = str(hsn_code).strip()
-    length = len(hsn_code)
-
-    # Only consider levels shorter than the given code (e.g., parents)
-    levels = [l for l in [2, 4, 6] if l < length]
-    
-    hierarchy = {}
-    for l in levels:
-        prefix = hsn_code[:l]
-        match = df[df['HSNCode'] == prefix]
-        hierarchy[prefix] = match.iloc[0]['Description'] if not match.empty else "Not found"
-
-    return hierarchy
-
-
-# Function to validate a single HSN code
-# ADK Intent: ValidateHSNCode
-def validate_hsn(hsn_code):
-    hsn_code = str(hsn_code).strip()
+    return _hierarchy(str(hsn_code).strip(), _dataset)
 
-    # Format check
-    if not hsn_code.isdigit() or len(hsn_code) not in [2, 4, 6, 8]:
-        log_invalid_hsn(hsn_code, "Invalid format")
-        return {"valid": False, "reason": "Invalid format"}
 
-    # Existence check
-    match = df[df['HSNCode'] == hsn_code]
-    if not match.empty:
-        description = match.iloc[0]['Description']
+# Builds the result for a well-formed code given its description (None if not in the dataset)
+def _build_result(hsn_code, description, dataset):
+    if description is not None:
         result = {
             "valid": True,
             "description": description
@@ -115,7 +253,7 @@ def validate_hsn(hsn_code):
 
         # Optional: Add hierarchy if it's an 8- or 6-digit code
         if len(hsn_code) in [6, 8]:
-            hierarchy = validate_hierarchy(hsn_code)
+            hierarchy = _hierarchy(hsn_code, dataset)
             result["hierarchy"] = {
                 level: desc if desc else "Not found"
                 for level, desc in hierarchy.items()
@@ -124,14 +262,54 @@ def validate_hsn(hsn_code):
         return result
 
     else:
-        log_invalid_hsn(hsn_code, "HSN code not found", invalid_attempts)
         return {"valid": False, "reason": "HSN code not found"}
 
+# Validation of a normalized code; pure once the dataset is loaded, so results are cached
+# (shared between callers, which must not mutate them)
+@lru_cache(maxsize=4096)
+def _check_hsn(hsn_code, dataset):
+    # Format check
+    if _HSN_FMT.match(hsn_code) is None:
+        return {"valid": False, "reason": "Invalid format"}
+
+    # Existence check
+    return _build_result(hsn_code, dataset.hsn_map.get(hsn_code), dataset)
+
+def _log_if_invalid(hsn_code, result):
+    if not result["valid"]:
+        log_invalid_hsn(hsn_code, result["reason"], invalid_attempts)
+
+
+# Function to validate a single HSN code
+# ADK Intent: ValidateHSNCode
+def validate_hsn(hsn_code):
+    hsn_code = str(hsn_code).strip()
+    result = _check_hsn(hsn_code, _dataset)
+    _log_if_invalid(hsn_code, result)
+    return result
+
 
 # Function to validate a list of HSN codes
 # ADK Intent: ValidateHSNCodesList
 def validate_hsn_list(hsn_list):
-    return [{"hsn_code": hsn, "result": validate_hsn(hsn)} for hsn in hsn_list]
+    hsn_list = list(hsn_list)
+    codes = [str(hsn).strip() for hsn in hsn_list]
+
+    # Validate each distinct code once (lists often repeat codes), through the same cache as validate_hsn
+    dataset = _dataset
+    cache = {code: _check_hsn(code, dataset) for code in dict.fromkeys(codes)}
+
+    # Every occurrence of an invalid code is logged, as with validate_hsn
+    results = []
+    for hsn, code in zip(hsn_list, codes):
+        result = cache[code]
+        _log_if_invalid(code, result)
+        results.append({"hsn_code": hsn, "result": result})
+    return results
+
+# Load the dataset once on startup
+load_dataset()
+
 
 # Optional CLI test (can be used for manual testing)
 if __name__ == "__main__":
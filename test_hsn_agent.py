@@ -1,8 +1,21 @@
 # Basic test script for HSN Code Validation Agent
 
 # import necessary libraries
+import os
+import shutil
+import tempfile
+from contextlib import contextmanager
+
+import pandas as pd
 import requests
-from hsn_agent import validate_hsn
+from requests.adapters import HTTPAdapter
+
+import hsn_agent
+from hsn_agent import validate_hsn, validate_hsn_list, validate_hierarchy, load_dataset, replace_dataset, extract_hsn_from_text
+
+# Shared HTTP session so API tests reuse pooled connections
+_session = requests.Session()
+_session.mount('http://', HTTPAdapter(pool_connections=10, pool_maxsize=10, max_retries=3))
 
 # Local Validation Logic Test
 def test_local_validation():
@@ -12,13 +25,106 @@ def test_local_validation():
         result = validate_hsn(code)
         print(f"[Local] {code}: {result}")
 
+# Batch validation must give the same result as validating each code on its own
+def test_batch_matches_single():
+    codes = ["0101", "01012100", "0101", "99999999", "abc", "123", None, 101, 1001, " 0101 ", "\u0660\u0661\u0660\u0661"]
+    for code, entry in zip(codes, validate_hsn_list(codes)):
+        assert entry["hsn_code"] == code
+        assert entry["result"] == validate_hsn(code), code
+
+# Extraction only picks up codes the validator accepts the format of
+def test_extract_ascii_digits():
+    assert extract_hsn_from_text("Check 0101 and \u0660\u0661\u0660\u0661") == ["0101"]
+
+# /chat replies follow the order the tokens appear in the message
+def test_chat_reply_order():
+    from agent_server import app
+    res = app.test_client().post("/chat", json={"message": "Check 99999999, 0101 and foo"})
+    lines = res.get_json()["reply"].split("\n")
+    positions = [
+        next(i for i, line in enumerate(lines) if token in line)
+        for token in ("99999999", "0101", "`foo`")
+    ]
+    assert positions == sorted(positions), lines
+
+# Contractions are checked as stop words and accented words are reported whole, not in pieces
+def test_chat_tokens():
+    from agent_server import app
+    res = app.test_client().post("/chat", json={"message": "I don't know, can't you check 0101 at the café?"})
+    flagged = {line.split("`")[1] for line in res.get_json()["reply"].split("\n") if "`" in line}
+    assert flagged == {"know", "café"}, flagged
+
+# Points hsn_agent at a throwaway dataset, then restores and reloads the real one
+@contextmanager
+def _temp_dataset():
+    tmp_dir = tempfile.mkdtemp()
+    saved = hsn_agent.EXCEL_PATH, hsn_agent.CACHE_PATH
+    hsn_agent.EXCEL_PATH = os.path.join(tmp_dir, "HSN_SAC.xlsx")
+    hsn_agent.CACHE_PATH = os.path.join(tmp_dir, "HSN_SAC.parquet")
+    try:
+        yield hsn_agent.EXCEL_PATH
+    finally:
+        hsn_agent.EXCEL_PATH, hsn_agent.CACHE_PATH = saved
+        load_dataset()
+        shutil.rmtree(tmp_dir)
+
+def _write_dataset(path, descriptions, mtime=None):
+    pd.DataFrame({
+        "HSNCode": list(descriptions),
+        "Description": list(descriptions.values()),
+    }).to_excel(path, index=False)
+    if mtime is not None:
+        os.utime(path, (mtime, mtime))
+
+# Cached validation results must not survive a reload
+def test_reload_invalidates_cache():
+    with _temp_dataset() as path:
+        _write_dataset(path, {"01": "ANIMALS", "0101": "OLD"})
+        load_dataset()
+        assert validate_hsn("0101")["description"] == "OLD"
+        assert validate_hierarchy("010121")["0101"] == "OLD"
+
+        _write_dataset(path, {"01": "ANIMALS", "0101": "NEW"})
+        load_dataset()
+        assert validate_hsn("0101")["description"] == "NEW"
+        assert validate_hierarchy("010121")["0101"] == "NEW"
+
+# A replacement Excel file older than the parquet cache must still be picked up
+def test_stale_cache_is_not_used():
+    with _temp_dataset() as path:
+        _write_dataset(path, {"0101": "OLD"})
+        load_dataset()
+        old_mtime = os.stat(path).st_mtime
+
+        _write_dataset(path, {"0101": "NEW"}, mtime=old_mtime - 3600)
+        load_dataset()
+        assert validate_hsn("0101")["description"] == "NEW"
+
+# An upload that does not load is deleted and leaves the current dataset in place
+def test_invalid_upload_is_rejected():
+    with _temp_dataset() as path:
+        _write_dataset(path, {"0101": "OLD"})
+        upload = os.path.join(os.path.dirname(path), "upload.xlsx")
+        pd.DataFrame({"Code": ["0101"]}).to_excel(upload, index=False)
+        try:
+            replace_dataset(upload)
+        except ValueError:
+            pass
+        else:
+            raise AssertionError("upload without an HSNCode column was accepted")
+        assert not os.path.exists(upload)
+
+        load_dataset()
+        assert validate_hsn("0101")["description"] == "OLD"
+
 # API Endpoint Test (/validate)
 def test_api_validation():
     print("\nTesting /validate API endpoint...")
     try:
-        res = requests.post(
+        res = _session.post(
             "http://127.0.0.1:5000/validate",
-            json={"hsn_code": "01012100"}
+            json={"hsn_code": "01012100"},
+            stream=False
         )
         print(f"[API] Status: {res.status_code}")
         print(f"[API] Response: {res.json()}")
@@ -30,4 +136,11 @@ def test_api_validation():
 # Run All Tests
 if __name__ == "__main__":
     test_local_validation()
+    test_batch_matches_single()
+    test_extract_ascii_digits()
+    test_chat_reply_order()
+    test_chat_tokens()
+    test_reload_invalidates_cache()
+    test_stale_cache_is_not_used()
+    test_invalid_upload_is_rejected()
     test_api_validation()
@@ -0,0 +1,5 @@
+# WSGI entry point for production servers
+
+# Run with gevent workers, one per CPU:
+# gunicorn -k gevent -w $(nproc) --worker-connections 1000 -b 0.0.0.0:5000 wsgi:app
+from agent_server import app